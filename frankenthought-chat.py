@@ -1,18 +1,60 @@
 import os
+import sys
 import json
 import asyncio
+import collections
+import functools
+import sqlite3
+import threading
+import time
+import hashlib
 from datetime import datetime
-from termcolor import colored
-import google.generativeai as genai
-from openai import AsyncOpenAI
+from pathlib import Path
+import orjson
+from aiolimiter import AsyncLimiter
+from terminal_colors import colored, print_token
 
 # Constants
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-CHAT_LOG_FILE = "chat_responses.json"
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+SYSTEM_PROMPT = "You are a helpful AI assistant."
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_TIMEOUT = 120.0  # Seconds for read/write/pool waits
+HTTP_CONNECT_TIMEOUT = 10.0
+API_MAX_RETRIES = 5
+RATE_LIMIT_PERIOD = 60  # Seconds over which each provider's request budget applies
+GEMINI_RATE_LIMIT = 10
+OPENAI_RATE_LIMIT = 60
+OPENROUTER_RATE_LIMIT = 200
+MAX_HISTORY_TOKENS = 6000  # Token budget for chat history sent with each request
+FALLBACK_ENCODING = "o200k_base"  # Tokenizer for models tiktoken does not know
+PROMPT_CACHE_FILE = "prompt_cache.db"
+PROMPT_CACHE_TTL = 1800  # Seconds before an exact-match cached response expires
+CHAT_LOG_FILE = "chat_responses.jsonl"
+LEGACY_CHAT_LOG_FILE = "chat_responses.json"  # Single JSON array written by older versions
+LOG_BATCH_SIZE = 64  # Max queued log entries written per flush
+CHAT_EXPORT_FILE = "chat_export.json"
+RESTORED_HISTORY_TURNS = 50  # Most recent logged turns restored into chat_history with --resume
+LOG_STREAM_THRESHOLD = 50 * 1024 * 1024  # Logs larger than this (bytes) are streamed line by line
+SEMANTIC_CACHE_FILE = "semantic_cache.jsonl"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_CONTEXT_MESSAGES = 2  # Recent history messages hashed into the cache key
+EMBEDDING_MODEL = "text-embedding-3-small"
+MIN_RESPONSES_FOR_SYNTHESIS = 2  # Start synthesizing once this many models have answered
+SYNTHESIS_SOFT_DEADLINE = 45  # Seconds after which synthesis starts with whatever has arrived
+MODEL_TIMEOUT = 180  # Seconds before a straggling model call is cancelled
+# Slower models always keep running until MODEL_TIMEOUT so their answers are logged;
+# this re-synthesizes the draft with them, at the cost of a second O1 call
+REFINE_WITH_LATE_RESPONSES = True
+SYNTHESIS_ERROR_PREFIXES = ("Synthesis Error", "Cannot synthesize")
 COMMANDS = {
     "--clear": "Clear the chat history",
+    "--nocache": "Toggle the semantic response cache",
+    "--cachestats": "Show semantic cache hit/miss stats",
+    "--export": "Export the chat log as pretty-printed JSON",
     "--exit": "Exit the chat",
     "--help": "Show available commands"
 }
@@ -26,34 +68,91 @@ GEMINI_CONFIG = {
     "response_mime_type": "text/plain",
 }
 
-# Initialize clients
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel(
-        model_name="gemini-2.0-flash-thinking-exp-01-21",
-        generation_config=GEMINI_CONFIG
-    )
-    print(colored("✓ Gemini initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing Gemini: {str(e)}", "red"))
-    gemini_model = None
-
-try:
-    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    print(colored("✓ OpenAI initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing OpenAI: {str(e)}", "red"))
-    openai_client = None
-
-try:
-    openrouter_client = AsyncOpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY
-    )
-    print(colored("✓ OpenRouter initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing OpenRouter: {str(e)}", "red"))
-    openrouter_client = None
+# Clients are created on first use so unused SDKs are never imported
+@functools.lru_cache(maxsize=1)
+def get_gemini_model():
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        gemini_model = genai.GenerativeModel(
+            model_name="gemini-2.0-flash-thinking-exp-01-21",
+            generation_config=GEMINI_CONFIG
+        )
+        print(colored("✓ Gemini initialized successfully", "green"))
+        return gemini_model
+    except Exception as e:
+        print(colored(f"✗ Error initializing Gemini: {str(e)}", "red"))
+        return None
+
+# One pooled HTTP client shared by every OpenAI-compatible client so keep-alive
+# connections are reused across the parallel calls instead of re-handshaking TLS
+@functools.lru_cache(maxsize=1)
+def get_http_client():
+    try:
+        import httpx
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+        print(colored("✓ HTTP connection pool initialized successfully", "green"))
+        return http_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing HTTP connection pool: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_openai_client():
+    try:
+        from openai import AsyncOpenAI
+        openai_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=get_http_client(),
+            max_retries=API_MAX_RETRIES
+        )
+        print(colored("✓ OpenAI initialized successfully", "green"))
+        return openai_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing OpenAI: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_openrouter_client():
+    try:
+        from openai import AsyncOpenAI
+        openrouter_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=OPENROUTER_API_KEY,
+            http_client=get_http_client(),
+            max_retries=API_MAX_RETRIES
+        )
+        print(colored("✓ OpenRouter initialized successfully", "green"))
+        return openrouter_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing OpenRouter: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_prompt_cache_db():
+    try:
+        prompt_cache_db = sqlite3.connect(PROMPT_CACHE_FILE)
+        prompt_cache_db.execute("PRAGMA journal_mode=WAL")
+        prompt_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        prompt_cache_db.commit()
+        print(colored("✓ Prompt cache initialized successfully", "green"))
+        return prompt_cache_db
+    except Exception as e:
+        print(colored(f"✗ Error initializing prompt cache: {str(e)}", "red"))
+        return None
+
+# Per-provider request rate limiters
+gemini_limiter = AsyncLimiter(GEMINI_RATE_LIMIT, RATE_LIMIT_PERIOD)
+openai_limiter = AsyncLimiter(OPENAI_RATE_LIMIT, RATE_LIMIT_PERIOD)
+openrouter_limiter = AsyncLimiter(OPENROUTER_RATE_LIMIT, RATE_LIMIT_PERIOD)
 
 # Available models
 MODELS = {
@@ -63,9 +162,113 @@ MODELS = {
     "qwen": "qwen/qwq-32b-preview"
 }
 
+MODEL_IDS = list(MODELS.values())
+
+# Order of the parallel responders - anonymous model numbers follow it
+RESPONDERS = ("gemini", "deepseek", "qwen", "o1")
+
 # Single shared chat history
 chat_history = []
 
+# Log entries waiting for the background writer
+log_queue = asyncio.Queue()
+
+# Tokenizers loaded in the background, keyed by model - models missing here are estimated
+encodings = {}
+
+# Futures for requests currently awaiting the API, keyed by prompt cache key
+inflight_requests = {}
+
+class SemanticCache:
+    def __init__(self, path, threshold, enabled=True):
+        self.path = path
+        self.threshold = threshold
+        self.enabled = enabled
+        self.entries = {}  # context hash -> (list of unit embeddings, list of responses)
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def _add(self, context, embedding, response):
+        import numpy as np
+        vector = np.asarray(embedding, dtype=np.float32)
+        vectors, responses = self.entries.setdefault(context, ([], []))
+        vectors.append(vector / np.linalg.norm(vector))
+        responses.append(response)
+
+    def load(self):
+        # Deferred to first use so startup, and runs with --nocache, never parse the file
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            if not os.path.exists(self.path):
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = orjson.loads(line)
+                        self._add(entry["context"], entry["embedding"], entry["response"])
+            print(colored(f"✓ Loaded {self.size()} semantic cache entries", "green"))
+        except Exception as e:
+            print(colored(f"Error loading semantic cache: {str(e)}", "red"))
+
+    def lookup(self, context, embedding):
+        self.load()
+        try:
+            import numpy as np
+            vectors, responses = self.entries.get(context, ([], []))
+            if vectors:
+                query = np.asarray(embedding, dtype=np.float32)
+                scores = np.stack(vectors) @ (query / np.linalg.norm(query))
+                best = int(np.argmax(scores))
+                if scores[best] > self.threshold:
+                    self.hits += 1
+                    return responses[best]
+        except Exception as e:
+            # e.g. stored embeddings from a different EMBEDDING_MODEL - treat as a miss
+            print(colored(f"Error reading semantic cache: {str(e)}", "red"))
+        self.misses += 1
+        return None
+
+    def _append(self, context, embedding, response):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(orjson.dumps({
+                "context": context,
+                "embedding": list(embedding),
+                "response": response
+            }).decode("utf-8") + "\n")
+
+    async def store(self, context, embedding, response):
+        try:
+            self.load()
+            self._add(context, embedding, response)
+            # Each entry is tens of KB of embedding text - write it off the event loop
+            await asyncio.to_thread(self._append, context, embedding, response)
+        except Exception as e:
+            print(colored(f"Error saving semantic cache: {str(e)}", "red"))
+
+    def size(self):
+        return sum(len(responses) for _, responses in self.entries.values())
+
+    def stats(self):
+        if self.enabled:
+            self.load()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_FILE,
+    SEMANTIC_CACHE_THRESHOLD,
+    enabled="--nocache" not in sys.argv
+)
+
 def print_commands():
     print(colored("\nAvailable Commands:", "yellow"))
     for cmd, desc in COMMANDS.items():
@@ -73,59 +276,313 @@ def print_commands():
 
 def load_chat_log():
     try:
-        if os.path.exists(CHAT_LOG_FILE):
-            with open(CHAT_LOG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
+        path = Path(CHAT_LOG_FILE)
+        if not path.exists():
+            return
+        if path.stat().st_size > LOG_STREAM_THRESHOLD:
+            # Stream very large logs one JSONL line at a time to bound memory
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield orjson.loads(line)
+            return
+        # One read and raw-bytes parsing, no per-chunk text decoding
+        for line in path.read_bytes().splitlines():
+            if line.strip():
+                yield orjson.loads(line)
     except Exception as e:
         print(colored(f"Error loading chat log: {str(e)}", "red"))
-        return []
 
-def save_chat_log(chat_log):
+def migrate_legacy_chat_log():
+    # One-time conversion of the old JSON array log - runs only while no JSONL log exists,
+    # and the old file is left in place untouched
+    try:
+        legacy_path = Path(LEGACY_CHAT_LOG_FILE)
+        if Path(CHAT_LOG_FILE).exists() or not legacy_path.exists():
+            return
+        entries = orjson.loads(legacy_path.read_bytes())
+        append_chat_log_entries(entries)
+        print(colored(f"✓ Converted {len(entries)} entries from {LEGACY_CHAT_LOG_FILE} to {CHAT_LOG_FILE}", "green"))
+    except Exception as e:
+        print(colored(f"Error converting {LEGACY_CHAT_LOG_FILE}: {str(e)}", "red"))
+
+def restore_chat_history():
+    # Opt-in with --resume: every model, the synthesizer and the semantic cache
+    # context start from the logged history, which is sent with each request
+    restored = collections.deque(maxlen=RESTORED_HISTORY_TURNS * 2)
+    for entry in load_chat_log():
+        if entry.get("event") == "clear":
+            restored.clear()
+            continue
+        restored.append({"role": "user", "content": entry["user_message"]})
+        restored.append({"role": "assistant", "content": entry["final_response"]})
+    chat_history.extend(restored)
+    if restored:
+        print(colored(f"✓ Restored {len(restored) // 2} previous turns (--clear to start fresh)", "green"))
+
+def append_chat_log_entries(entries):
+    # Append only the new entries - past entries are never re-read or rewritten
     try:
-        with open(CHAT_LOG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(chat_log, f, indent=2, ensure_ascii=False)
+        with open(CHAT_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write("".join(orjson.dumps(entry).decode("utf-8") + "\n" for entry in entries))
     except Exception as e:
         print(colored(f"Error saving chat log: {str(e)}", "red"))
 
-async def get_gemini_response(message):
+async def chat_log_writer():
+    # Drain the queue in batches so disk writes never block the chat loop
+    while True:
+        batch = [await log_queue.get()]
+        while not log_queue.empty() and len(batch) < LOG_BATCH_SIZE:
+            batch.append(log_queue.get_nowait())
+        await asyncio.to_thread(append_chat_log_entries, batch)
+        for _ in batch:
+            log_queue.task_done()
+
+def save_chat_log(entry):
+    log_queue.put_nowait(entry)
+
+def pretty_export():
+    # Indented copy of the log for human viewing - the hot path stays compact JSONL
+    try:
+        entries = list(load_chat_log())
+        with open(CHAT_EXPORT_FILE, 'w', encoding='utf-8') as f:
+            f.write(orjson.dumps(entries, option=orjson.OPT_INDENT_2).decode("utf-8"))
+        print(colored(f"\nExported {len(entries)} entries to {CHAT_EXPORT_FILE}", "green"))
+    except Exception as e:
+        print(colored(f"Error exporting chat log: {str(e)}", "red"))
+
+def history_hash(history):
+    recent = history[-SEMANTIC_CACHE_CONTEXT_MESSAGES:] if SEMANTIC_CACHE_CONTEXT_MESSAGES else []
+    return hashlib.sha256(json.dumps(recent, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+async def get_embedding(message):
     try:
+        openai_client = get_openai_client()
+        if not openai_client:
+            return None
+        response = await openai_client.embeddings.create(model=EMBEDDING_MODEL, input=message)
+        return response.data[0].embedding
+    except Exception as e:
+        print(colored(f"Embedding Error (semantic cache skipped): {str(e)}", "red"))
+        return None
+
+def load_encodings(models):
+    # tiktoken downloads its BPE files on first use with no timeout, so this
+    # only ever runs in the background thread started by start_encoding_load
+    import tiktoken
+    for model in models:
+        if model in encodings:
+            continue
+        try:
+            try:
+                encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encodings[model] = tiktoken.get_encoding(FALLBACK_ENCODING)
+        except Exception as e:
+            print(colored(f"Error loading tokenizers, estimating tokens from length: {str(e)}", "red"))
+            return
+
+def start_encoding_load(models):
+    # Startup never waits on it - count_tokens estimates until each tokenizer is in.
+    # A daemon thread rather than to_thread, since asyncio.run joins the default
+    # executor at shutdown and a hung download would then hang exit
+    threading.Thread(target=load_encodings, args=(models,), daemon=True).start()
+
+def count_tokens(text, model):
+    encoding = encodings.get(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+def trim_history(messages, model, max_tokens=MAX_HISTORY_TOKENS):
+    # Keep the newest messages that fit in the token budget
+    kept = []
+    total = 0
+    for msg in reversed(messages):
+        total += count_tokens(msg["content"] or "", model)
+        if total > max_tokens:
+            break
+        kept.append(msg)
+    kept.reverse()
+    # Don't start the window on an orphaned assistant reply
+    while kept and kept[0]["role"] == "assistant":
+        kept.pop(0)
+    return kept
+
+def prompt_cache_key(model, messages):
+    payload = json.dumps({"m": model, "x": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_prompt_response(key):
+    try:
+        prompt_cache_db = get_prompt_cache_db()
+        if not prompt_cache_db:
+            return None
+        row = prompt_cache_db.execute(
+            "SELECT response FROM prompt_cache WHERE key = ? AND created_at > ?",
+            (key, time.time() - PROMPT_CACHE_TTL)
+        ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(colored(f"Error reading prompt cache: {str(e)}", "red"))
+        return None
+
+def save_prompt_response(key, response):
+    try:
+        prompt_cache_db = get_prompt_cache_db()
+        if not prompt_cache_db or response is None:
+            return
+        prompt_cache_db.execute(
+            "INSERT OR REPLACE INTO prompt_cache (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, time.time())
+        )
+        prompt_cache_db.commit()
+    except Exception as e:
+        print(colored(f"Error saving prompt cache: {str(e)}", "red"))
+
+def get_limiter(client):
+    return openrouter_limiter if str(client.base_url).startswith(OPENROUTER_BASE_URL) else openai_limiter
+
+async def stream_completion(client, model, messages, on_token=None):
+    # Returns (full_text, first_token_latency) while handing each token to on_token as it arrives
+    started = time.perf_counter()
+    first_token_latency = None
+    parts = []
+    async with get_limiter(client):
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True
+        )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if not token:
+            continue
+        if first_token_latency is None:
+            first_token_latency = time.perf_counter() - started
+        parts.append(token)
+        if on_token:
+            on_token(token)
+    return "".join(parts), first_token_latency
+
+def to_gemini_history(messages):
+    return [
+        {"role": "model" if msg["role"] == "assistant" else "user", "parts": [msg["content"]]}
+        for msg in messages
+        if msg["content"]
+    ]
+
+async def stream_gemini_message(chat, message, on_token=None):
+    started = time.perf_counter()
+    first_token_latency = None
+    parts = []
+    # Native async API keeps the event loop free without a thread hop
+    response = await chat.send_message_async(message, stream=True)
+    async for chunk in response:
+        token = chunk.text
+        if not token:
+            continue
+        if first_token_latency is None:
+            first_token_latency = time.perf_counter() - started
+        parts.append(token)
+        if on_token:
+            on_token(token)
+    return "".join(parts), first_token_latency
+
+async def create_completion(client, model, messages, on_token=None):
+    key = prompt_cache_key(model, messages)
+    cached_response = get_cached_prompt_response(key)
+    if cached_response is not None:
+        print(colored(f"✓ Prompt cache hit for {model}", "green"))
+        if on_token:
+            on_token(cached_response)
+        return cached_response, 0.0
+
+    # Identical requests already on the wire share a single API call
+    inflight = inflight_requests.get(key)
+    if inflight:
+        print(colored(f"Joining in-flight {model} request...", "cyan"))
+        content, first_token_latency = await asyncio.shield(inflight)
+        if on_token:
+            on_token(content)
+        return content, first_token_latency
+
+    inflight = asyncio.get_running_loop().create_future()
+    inflight_requests[key] = inflight
+    try:
+        content, first_token_latency = await stream_completion(client, model, messages, on_token)
+        save_prompt_response(key, content)
+        inflight.set_result((content, first_token_latency))
+    except Exception as e:
+        inflight.set_exception(e)
+    finally:
+        if not inflight.done():
+            inflight.cancel()
+        del inflight_requests[key]
+    return await inflight
+
+async def get_gemini_response(history, message):
+    try:
+        gemini_model = get_gemini_model()
         if not gemini_model:
-            return "Gemini model not available"
+            return {"ok": False, "err": "Gemini model not available"}
         
-        if not hasattr(get_gemini_response, 'chat'):
-            get_gemini_response.chat = gemini_model.start_chat(history=[])
-            for msg in chat_history:
-                if msg["role"] == "user":
-                    get_gemini_response.chat.send_message(msg["content"])
+        # A fresh session per turn, seeded locally from the trimmed shared history -
+        # no API round trips, history stays within MAX_HISTORY_TOKENS, and a stream
+        # cancelled at MODEL_TIMEOUT or broken mid-way can't poison later turns
+        gemini_chat = gemini_model.start_chat(
+            history=to_gemini_history(trim_history(history, MODELS["gemini"]))
+        )
                     
         print(colored("Waiting for Gemini response...", "cyan"))
-        response = get_gemini_response.chat.send_message(message)
-        return response.text
+        async with gemini_limiter:
+            text, first_token_latency = await stream_gemini_message(gemini_chat, message)
+        return {"ok": True, "text": text, "ttft": first_token_latency}
     except Exception as e:
-        return f"Gemini Error: {str(e)}"
+        return {"ok": False, "err": f"Gemini Error: {str(e)}"}
 
-async def get_openai_response(client, model, message):
+async def get_openai_response(client, model, history, message):
     try:
         if not client:
-            return f"{model} client not available"
+            return {"ok": False, "err": f"{model} client not available"}
             
         print(colored(f"Waiting for {model} response...", "cyan"))
-        messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
-        messages.extend(chat_history)
-        messages.append({"role": "user", "content": message})
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *trim_history(history, model),
+            {"role": "user", "content": message}
+        ]
         
-        response = await client.chat.completions.create(
-            model=model,
-            messages=messages
-        )
-        return response.choices[0].message.content
+        text, first_token_latency = await create_completion(client, model, messages)
+        return {"ok": True, "text": text, "ttft": first_token_latency}
     except Exception as e:
-        return f"{model} Error: {str(e)}"
+        return {"ok": False, "err": f"{model} Error: {str(e)}"}
 
-async def synthesize_responses(user_message, responses):
+def is_synthesis_error(response):
+    return response.startswith(SYNTHESIS_ERROR_PREFIXES)
+
+async def synthesize_responses(user_message, responses, draft=None, title="FINAL SYNTHESIZED RESPONSE"):
     try:
+        # Failed and still-pending models are left out so O1 never reasons over error text
+        usable = [
+            (number, responses[name]["text"])
+            for number, name in enumerate(RESPONDERS, 1)
+            if name in responses and responses[name]["ok"]
+        ]
+        if not usable:
+            print(colored("Cannot synthesize: no model returned a usable response", "red"))
+            return "Cannot synthesize: no model returned a usable response"
+        if len(usable) == 1:
+            print(colored("Only one model answered - skipping synthesis", "cyan"))
+            print(colored(f"\n{title}:", "green"))
+            print(colored(usable[0][1], "green"))
+            return usable[0][1]
+
+        openai_client = get_openai_client()
         if not openai_client:
+            print(colored("Cannot synthesize: OpenAI O1 not available", "red"))
             return "Cannot synthesize: OpenAI O1 not available"
             
         synthesis_prompt = f"""As an AI synthesizer, analyze these AI responses to the user's message and create a comprehensive, accurate response that combines the best insights from all sources.
@@ -133,11 +590,17 @@ async def synthesize_responses(user_message, responses):
 User's Message: {user_message}
 
 Responses from different AI models:
-Model 1: {responses['gemini']}
-Model 2: {responses['deepseek']}
-Model 3: {responses['qwen']}
-Model 4: {responses['o1']}
+"""
+        for number, text in usable:
+            synthesis_prompt += f"Model {number}: {text}\n"
+        if draft:
+            synthesis_prompt += f"""
+A draft synthesis was written before every model had answered:
+{draft}
 
+Refine the draft using the responses that arrived since.
+"""
+        synthesis_prompt += """
 Create a well-structured response that:
 1. Combines the unique insights from each model
 2. Resolves any contradictions between the responses
@@ -152,56 +615,151 @@ Create a well-structured response that:
         ]
         
         print(colored("Synthesizing final response with O1...", "cyan"))
-        response = await openai_client.chat.completions.create(
-            model=MODELS["o1"],
-            messages=messages
+        print(colored(f"\n{title}:", "green"))
+        final_response, first_token_latency = await stream_completion(
+            openai_client, MODELS["o1"], messages, on_token=print_token
         )
-        return response.choices[0].message.content
+        print()
+        if first_token_latency is not None:
+            print(colored(f"(first token after {first_token_latency:.2f}s)", "cyan"))
+        return final_response
     except Exception as e:
+        print(colored(f"\nSynthesis Error: {str(e)}", "red"))
         return f"Synthesis Error: {str(e)}"
 
+def task_result(name, task):
+    # Exceptions escaping a responder become failed results, like gather(return_exceptions=True).
+    # CancelledError is a BaseException, so it needs its own branch - e.g. a joined
+    # in-flight request cancelled by the task that owns it
+    try:
+        return task.result()
+    except asyncio.CancelledError:
+        return {"ok": False, "err": f"{name} Error: request was cancelled"}
+    except Exception as e:
+        return {"ok": False, "err": f"{name} Error: {str(e)}"}
+
 async def process_message(message):
-    # Get responses from all models in parallel
-    responses = {}
-    tasks = [
-        asyncio.create_task(get_gemini_response(message)),
-        asyncio.create_task(get_openai_response(openrouter_client, MODELS["deepseek"], message)),
-        asyncio.create_task(get_openai_response(openrouter_client, MODELS["qwen"], message)),
-        asyncio.create_task(get_openai_response(openai_client, MODELS["o1"], message))
-    ]
-    
-    results = await asyncio.gather(*tasks)
-    
-    # Store responses with actual model names
-    responses = {
-        "gemini": results[0],
-        "deepseek": results[1],
-        "qwen": results[2],
-        "o1": results[3]
-    }
+    # Immutable snapshot shared by every parallel call - chat_history is only
+    # appended to once the final response is ready
+    history = tuple(chat_history)
+
+    # Check the semantic cache before fanning out to every model
+    context = history_hash(history)
+    embedding = None
+    if semantic_cache.enabled:
+        print(colored("Checking semantic cache...", "cyan"))
+        embedding = await get_embedding(message)
+        cached_response = semantic_cache.lookup(context, embedding) if embedding is not None else None
+        if cached_response is not None:
+            print(colored("✓ Semantic cache hit - skipping model calls", "green"))
+            print(colored("\nFINAL SYNTHESIZED RESPONSE:", "green"))
+            print(colored(cached_response, "green"))
+            chat_history.append({"role": "user", "content": message})
+            chat_history.append({"role": "assistant", "content": cached_response})
+            save_chat_log({
+                "timestamp": datetime.now().isoformat(),
+                "user_message": message,
+                "model_responses": {},
+                "final_response": cached_response,
+                "semantic_cache_hit": True
+            })
+            return cached_response
+
+    # Get responses from all models in parallel - one task per model, with
+    # MODEL_TIMEOUT enforced by the wait deadline rather than a wait_for wrapper task
+    coros = (
+        get_gemini_response(history, message),
+        get_openai_response(get_openrouter_client(), MODELS["deepseek"], history, message),
+        get_openai_response(get_openrouter_client(), MODELS["qwen"], history, message),
+        get_openai_response(get_openai_client(), MODELS["o1"], history, message)
+    )
+    tasks = {asyncio.create_task(coro): name for name, coro in zip(RESPONDERS, coros)}
+    pending = set(tasks)
     
-    # Print individual responses with anonymous model numbers
+    # Store typed results with actual model names
+    responses = {}
+
+    def collect(done):
+        # Print individual responses with anonymous model numbers as they arrive
+        for task in done:
+            name = tasks[task]
+            result = responses[name] = task_result(name, task)
+            number = RESPONDERS.index(name) + 1
+            if result["ok"]:
+                latency = f" (first token after {result['ttft']:.2f}s)" if result["ttft"] is not None else ""
+                print(colored(f"\nModel {number}{latency}:", "yellow"))
+                print(colored(result["text"], "white"))
+            else:
+                print(colored(f"\nModel {number}:", "yellow"))
+                print(colored(result["err"], "red"))
+
+    def usable_count():
+        return sum(result["ok"] for result in responses.values())
+
+    # Fast path: synthesize once enough models have answered, or once the soft
+    # deadline passes with at least one answer, instead of waiting on the slowest
     print("\nIndividual model responses:")
-    for i, response in enumerate(responses.values(), 1):
-        print(colored(f"\nModel {i}:", "yellow"))
-        print(colored(response, "white"))
+    started = time.perf_counter()
+    while pending:
+        elapsed = time.perf_counter() - started
+        if usable_count() >= MIN_RESPONSES_FOR_SYNTHESIS or (usable_count() and elapsed >= SYNTHESIS_SOFT_DEADLINE):
+            break
+        if elapsed >= MODEL_TIMEOUT:
+            break
+        deadline = SYNTHESIS_SOFT_DEADLINE if usable_count() else MODEL_TIMEOUT
+        done, pending = await asyncio.wait(pending, timeout=deadline - elapsed, return_when=asyncio.FIRST_COMPLETED)
+        collect(done)
+
+    refine = bool(pending) and REFINE_WITH_LATE_RESPONSES
     
-    # Get final synthesized response
-    final_response = await synthesize_responses(message, responses)
+    # Get final synthesized response from the models that have answered so far
+    final_response = await synthesize_responses(
+        message,
+        responses,
+        title="DRAFT SYNTHESIZED RESPONSE (slower models still working)" if refine else "FINAL SYNTHESIZED RESPONSE"
+    )
+
+    if pending:
+        # Stragglers kept running during synthesis - wait for them up to MODEL_TIMEOUT, then cancel
+        remaining = max(MODEL_TIMEOUT - (time.perf_counter() - started), 0)
+        done, timed_out = await asyncio.wait(pending, timeout=remaining)
+        late = [tasks[task] for task in done]
+        collect(done)
+        for task in timed_out:
+            task.cancel()
+            name = tasks[task]
+            responses[name] = {"ok": False, "err": f"{name} Error: no response within {MODEL_TIMEOUT}s"}
+            print(colored(f"\nModel {RESPONDERS.index(name) + 1}:", "yellow"))
+            print(colored(responses[name]["err"], "red"))
+        if refine and any(responses[name]["ok"] for name in late):
+            draft = None if is_synthesis_error(final_response) else final_response
+            refined_response = await synthesize_responses(
+                message, responses, draft=draft, title="REFINED FINAL RESPONSE"
+            )
+            if not is_synthesis_error(refined_response):
+                final_response = refined_response
+        elif refine:
+            print(colored("\nNo usable late responses - the draft is the final response", "cyan"))
+
+    # Only cache successful syntheses
+    if embedding is not None and not is_synthesis_error(final_response):
+        await semantic_cache.store(context, embedding, final_response)
     
     # Save to chat history (anonymized for chat context)
     chat_history.append({"role": "user", "content": message})
     chat_history.append({"role": "assistant", "content": final_response})
     
     # Save to log file with actual model names
-    chat_log = load_chat_log()
-    chat_log.append({
+    save_chat_log({
         "timestamp": datetime.now().isoformat(),
         "user_message": message,
-        "model_responses": responses,  # Original model names preserved in log
+        # Original model names preserved in log
+        "model_responses": {
+            name: result["text"] if result["ok"] else result["err"] for name, result in responses.items()
+        },
+        "first_token_latencies": {name: result.get("ttft") for name, result in responses.items()},
         "final_response": final_response
     })
-    save_chat_log(chat_log)
     
     return final_response
 
@@ -212,6 +770,9 @@ async def main():
     
     while True:
         try:
+            # input() blocks the event loop, so let the writer finish the last
+            # turn's log entries before prompting
+            await log_queue.join()
             message = input(colored("\nYou: ", "cyan")).strip()
             
             if message.lower() == "--exit":
@@ -224,20 +785,55 @@ async def main():
                 
             elif message.lower() == "--clear":
                 chat_history.clear()
-                if hasattr(get_gemini_response, 'chat'):
-                    delattr(get_gemini_response, 'chat')
+                # Marks where a restart should resume history from
+                save_chat_log({"timestamp": datetime.now().isoformat(), "event": "clear"})
                 print(colored("\nChat history cleared", "green"))
                 continue
+
+            elif message.lower() == "--nocache":
+                semantic_cache.enabled = not semantic_cache.enabled
+                state = "enabled" if semantic_cache.enabled else "disabled"
+                print(colored(f"\nSemantic cache {state}", "green"))
+                continue
+
+            elif message.lower() == "--export":
+                # Make sure queued entries are on disk before exporting
+                await log_queue.join()
+                pretty_export()
+                continue
+
+            elif message.lower() == "--cachestats":
+                stats = semantic_cache.stats()
+                print(colored("\nSemantic Cache Stats:", "yellow"))
+                print(colored(f"Enabled: {stats['enabled']}", "yellow"))
+                print(colored(f"Entries: {stats['entries']}", "yellow"))
+                print(colored(f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate']:.1%}", "yellow"))
+                continue
                 
             if not message:
                 continue
                 
-            final_response = await process_message(message)
-            print(colored("\nFINAL SYNTHESIZED RESPONSE:", "green"))
-            print(colored(final_response, "green"))
+            # The final response is streamed to the terminal as it is synthesized
+            await process_message(message)
             
         except Exception as e:
             print(colored(f"An error occurred: {str(e)}", "red"))
 
+async def run():
+    migrate_legacy_chat_log()
+    start_encoding_load(MODEL_IDS)
+    if "--resume" in sys.argv:
+        restore_chat_history()
+    writer = asyncio.create_task(chat_log_writer())
+    try:
+        await main()
+    finally:
+        # Flush queued log entries before shutting down
+        await log_queue.join()
+        writer.cancel()
+        # Only close the HTTP pool if something actually created it
+        if get_http_client.cache_info().currsize and get_http_client():
+            await get_http_client().aclose()
+
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(run()) 
\ No newline at end of file
@@ -1,13 +1,33 @@
 import os
+import json
 import asyncio
-from termcolor import colored
-import google.generativeai as genai
-from openai import AsyncOpenAI
+import functools
+import hashlib
+import sqlite3
+import threading
+import time
+from aiolimiter import AsyncLimiter
+from terminal_colors import colored, print_token
 
 # Constants
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+SYSTEM_PROMPT = "You are a helpful AI assistant."
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_TIMEOUT = 120.0  # Seconds for read/write/pool waits
+HTTP_CONNECT_TIMEOUT = 10.0
+API_MAX_RETRIES = 5
+RATE_LIMIT_PERIOD = 60  # Seconds over which each provider's request budget applies
+GEMINI_RATE_LIMIT = 10
+OPENAI_RATE_LIMIT = 60
+OPENROUTER_RATE_LIMIT = 200
+MAX_HISTORY_TOKENS = 6000  # Token budget for chat history sent with each request
+FALLBACK_ENCODING = "o200k_base"  # Tokenizer for models tiktoken does not know
+PROMPT_CACHE_FILE = "prompt_cache.db"
+PROMPT_CACHE_TTL = 1800  # Seconds before an exact-match cached response expires
 COMMANDS = {
     "--change": "Change the current model",
     "--clear": "Clear the chat history",
@@ -24,34 +44,90 @@ GEMINI_CONFIG = {
     "response_mime_type": "text/plain",
 }
 
-# Initialize clients
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    gemini_model = genai.GenerativeModel(
-        model_name="gemini-2.0-flash-thinking-exp-01-21",
-        generation_config=GEMINI_CONFIG
-    )
-    print(colored("✓ Gemini initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing Gemini: {str(e)}", "red"))
-    gemini_model = None
-
-try:
-    openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-    print(colored("✓ OpenAI initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing OpenAI: {str(e)}", "red"))
-    openai_client = None
-
-try:
-    openrouter_client = AsyncOpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=OPENROUTER_API_KEY
-    )
-    print(colored("✓ OpenRouter initialized successfully", "green"))
-except Exception as e:
-    print(colored(f"✗ Error initializing OpenRouter: {str(e)}", "red"))
-    openrouter_client = None
+# Clients are created on first use so unused SDKs are never imported
+@functools.lru_cache(maxsize=1)
+def get_gemini_model():
+    try:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        gemini_model = genai.GenerativeModel(
+            model_name="gemini-2.0-flash-thinking-exp-01-21",
+            generation_config=GEMINI_CONFIG
+        )
+        print(colored("✓ Gemini initialized successfully", "green"))
+        return gemini_model
+    except Exception as e:
+        print(colored(f"✗ Error initializing Gemini: {str(e)}", "red"))
+        return None
+
+# Pooled HTTP client shared by OpenAI and OpenRouter
+@functools.lru_cache(maxsize=1)
+def get_http_client():
+    try:
+        import httpx
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        )
+        print(colored("✓ HTTP connection pool initialized successfully", "green"))
+        return http_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing HTTP connection pool: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_openai_client():
+    try:
+        from openai import AsyncOpenAI
+        openai_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=get_http_client(),
+            max_retries=API_MAX_RETRIES
+        )
+        print(colored("✓ OpenAI initialized successfully", "green"))
+        return openai_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing OpenAI: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_openrouter_client():
+    try:
+        from openai import AsyncOpenAI
+        openrouter_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=OPENROUTER_API_KEY,
+            http_client=get_http_client(),
+            max_retries=API_MAX_RETRIES
+        )
+        print(colored("✓ OpenRouter initialized successfully", "green"))
+        return openrouter_client
+    except Exception as e:
+        print(colored(f"✗ Error initializing OpenRouter: {str(e)}", "red"))
+        return None
+
+@functools.lru_cache(maxsize=1)
+def get_prompt_cache_db():
+    try:
+        prompt_cache_db = sqlite3.connect(PROMPT_CACHE_FILE)
+        prompt_cache_db.execute("PRAGMA journal_mode=WAL")
+        prompt_cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        prompt_cache_db.commit()
+        print(colored("✓ Prompt cache initialized successfully", "green"))
+        return prompt_cache_db
+    except Exception as e:
+        print(colored(f"✗ Error initializing prompt cache: {str(e)}", "red"))
+        return None
+
+# Per-provider request rate limiters
+gemini_limiter = AsyncLimiter(GEMINI_RATE_LIMIT, RATE_LIMIT_PERIOD)
+openai_limiter = AsyncLimiter(OPENAI_RATE_LIMIT, RATE_LIMIT_PERIOD)
+openrouter_limiter = AsyncLimiter(OPENROUTER_RATE_LIMIT, RATE_LIMIT_PERIOD)
 
 # Available models
 MODELS = {
@@ -64,6 +140,12 @@ MODELS = {
 # Single shared chat history
 chat_history = []
 
+# Tokenizers loaded in the background, keyed by model - models missing here are estimated
+encodings = {}
+
+# Futures for requests currently awaiting the API, keyed by prompt cache key
+inflight_requests = {}
+
 def print_models():
     print(colored("\nAvailable Models:", "yellow"))
     for num, (name, _) in MODELS.items():
@@ -89,62 +171,233 @@ def get_model_choice():
         except ValueError:
             print(colored("Please enter a valid number.", "red"))
 
-async def send_openai_message(client, model, message):
+def load_encodings(models):
+    # tiktoken downloads its BPE files on first use with no timeout, so this
+    # only ever runs in the background thread started by start_encoding_load
+    import tiktoken
+    for model in models:
+        if model in encodings:
+            continue
+        try:
+            try:
+                encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encodings[model] = tiktoken.get_encoding(FALLBACK_ENCODING)
+        except Exception as e:
+            print(colored(f"Error loading tokenizers, estimating tokens from length: {str(e)}", "red"))
+            return
+
+def start_encoding_load(models):
+    # Startup never waits on it - count_tokens estimates until each tokenizer is in.
+    # A daemon thread rather than to_thread, since asyncio.run joins the default
+    # executor at shutdown and a hung download would then hang exit
+    threading.Thread(target=load_encodings, args=(models,), daemon=True).start()
+
+def count_tokens(text, model):
+    encoding = encodings.get(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+def trim_history(messages, model, max_tokens=MAX_HISTORY_TOKENS):
+    # Keep the newest messages that fit in the token budget
+    kept = []
+    total = 0
+    for msg in reversed(messages):
+        total += count_tokens(msg["content"] or "", model)
+        if total > max_tokens:
+            break
+        kept.append(msg)
+    kept.reverse()
+    # Don't start the window on an orphaned assistant reply
+    while kept and kept[0]["role"] == "assistant":
+        kept.pop(0)
+    return kept
+
+def prompt_cache_key(model, messages):
+    payload = json.dumps({"m": model, "x": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached_prompt_response(key):
     try:
-        messages = [{"role": "system", "content": "You are a helpful AI assistant."}]
-        messages.extend(chat_history)
-        messages.append({"role": "user", "content": message})
-        
-        response = await client.chat.completions.create(
+        prompt_cache_db = get_prompt_cache_db()
+        if not prompt_cache_db:
+            return None
+        row = prompt_cache_db.execute(
+            "SELECT response FROM prompt_cache WHERE key = ? AND created_at > ?",
+            (key, time.time() - PROMPT_CACHE_TTL)
+        ).fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(colored(f"Error reading prompt cache: {str(e)}", "red"))
+        return None
+
+def save_prompt_response(key, response):
+    try:
+        prompt_cache_db = get_prompt_cache_db()
+        if not prompt_cache_db or response is None:
+            return
+        prompt_cache_db.execute(
+            "INSERT OR REPLACE INTO prompt_cache (key, response, created_at) VALUES (?, ?, ?)",
+            (key, response, time.time())
+        )
+        prompt_cache_db.commit()
+    except Exception as e:
+        print(colored(f"Error saving prompt cache: {str(e)}", "red"))
+
+def get_limiter(client):
+    return openrouter_limiter if str(client.base_url).startswith(OPENROUTER_BASE_URL) else openai_limiter
+
+async def stream_completion(client, model, messages, on_token=None):
+    # Returns (full_text, first_token_latency) while handing each token to on_token as it arrives
+    started = time.perf_counter()
+    first_token_latency = None
+    parts = []
+    async with get_limiter(client):
+        stream = await client.chat.completions.create(
             model=model,
-            messages=messages
+            messages=messages,
+            stream=True
         )
-        return response.choices[0].message.content
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if not token:
+            continue
+        if first_token_latency is None:
+            first_token_latency = time.perf_counter() - started
+        parts.append(token)
+        if on_token:
+            on_token(token)
+    return "".join(parts), first_token_latency
+
+def to_gemini_history(messages):
+    return [
+        {"role": "model" if msg["role"] == "assistant" else "user", "parts": [msg["content"]]}
+        for msg in messages
+        if msg["content"]
+    ]
+
+async def stream_gemini_message(chat, message, on_token=None):
+    started = time.perf_counter()
+    first_token_latency = None
+    parts = []
+    # Native async API keeps the event loop free without a thread hop
+    response = await chat.send_message_async(message, stream=True)
+    async for chunk in response:
+        token = chunk.text
+        if not token:
+            continue
+        if first_token_latency is None:
+            first_token_latency = time.perf_counter() - started
+        parts.append(token)
+        if on_token:
+            on_token(token)
+    return "".join(parts), first_token_latency
+
+async def create_completion(client, model, messages, on_token=None):
+    key = prompt_cache_key(model, messages)
+    cached_response = get_cached_prompt_response(key)
+    if cached_response is not None:
+        print(colored(f"✓ Prompt cache hit for {model}", "green"))
+        if on_token:
+            on_token(cached_response)
+        return cached_response, 0.0
+
+    # Identical requests already on the wire share a single API call
+    inflight = inflight_requests.get(key)
+    if inflight:
+        print(colored(f"Joining in-flight {model} request...", "cyan"))
+        content, first_token_latency = await asyncio.shield(inflight)
+        if on_token:
+            on_token(content)
+        return content, first_token_latency
+
+    inflight = asyncio.get_running_loop().create_future()
+    inflight_requests[key] = inflight
+    try:
+        content, first_token_latency = await stream_completion(client, model, messages, on_token)
+        save_prompt_response(key, content)
+        inflight.set_result((content, first_token_latency))
+    except Exception as e:
+        inflight.set_exception(e)
+    finally:
+        if not inflight.done():
+            inflight.cancel()
+        del inflight_requests[key]
+    return await inflight
+
+async def send_openai_message(client, model, history, message, on_token=None):
+    try:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            *trim_history(history, model),
+            {"role": "user", "content": message}
+        ]
+        
+        return await create_completion(client, model, messages, on_token)
     except Exception as e:
-        return f"Error: {str(e)}"
+        return f"Error: {str(e)}", None
 
 async def chat_with_model(model_choice, message):
     try:
         model_name = MODELS[model_choice][0]
         model_id = MODELS[model_choice][1]
+        history = tuple(chat_history)
         
         print(colored(f"\nSending message to {model_name}...", "cyan"))
+
+        # Print the model name only once the first token arrives, then stream the rest
+        header_printed = False
+        def on_token(token):
+            nonlocal header_printed
+            if not header_printed:
+                print(colored(f"\n{model_name}: ", "green"), end="")
+                header_printed = True
+            print_token(token)
         
-        if model_choice == 1 and gemini_model:  # Gemini
-            if not hasattr(chat_with_model, 'gemini_chat'):
-                chat_with_model.gemini_chat = gemini_model.start_chat(history=[])
-                # Convert existing history to Gemini format and replay
-                for msg in chat_history:
-                    if msg["role"] == "user":
-                        chat_with_model.gemini_chat.send_message(msg["content"])
-            response = chat_with_model.gemini_chat.send_message(message)
+        # Only the chosen provider's client is ever created
+        if model_choice == 1 and get_gemini_model():  # Gemini
+            # Seed a session from the shared history on every turn so replies from
+            # other models since a --change are included. start_chat is local - the
+            # whole history rides along with the one request instead of being replayed
+            gemini_chat = get_gemini_model().start_chat(
+                history=to_gemini_history(trim_history(history, model_id))
+            )
+            async with gemini_limiter:
+                response, first_token_latency = await stream_gemini_message(
+                    gemini_chat, message, on_token
+                )
             chat_history.append({"role": "user", "content": message})
-            chat_history.append({"role": "assistant", "content": response.text})
-            return response.text
+            chat_history.append({"role": "assistant", "content": response})
+            return response, first_token_latency
             
-        elif model_choice == 2 and openai_client:  # OpenAI
-            response = await send_openai_message(openai_client, model_id, message)
+        elif model_choice == 2 and get_openai_client():  # OpenAI
+            response, first_token_latency = await send_openai_message(get_openai_client(), model_id, history, message, on_token)
             chat_history.append({"role": "user", "content": message})
             chat_history.append({"role": "assistant", "content": response})
-            return response
+            return response, first_token_latency
             
-        elif model_choice in [3, 4] and openrouter_client:  # OpenRouter models
-            response = await send_openai_message(openrouter_client, model_id, message)
+        elif model_choice in [3, 4] and get_openrouter_client():  # OpenRouter models
+            response, first_token_latency = await send_openai_message(get_openrouter_client(), model_id, history, message, on_token)
             chat_history.append({"role": "user", "content": message})
             chat_history.append({"role": "assistant", "content": response})
-            return response
+            return response, first_token_latency
             
         else:
-            return "Selected model is not available."
+            return "Selected model is not available.", None
             
     except Exception as e:
-        return f"Error: {str(e)}"
+        return f"Error: {str(e)}", None
 
 async def main():
     print_commands()
     current_model = get_model_choice()
     if current_model is None:
         return
+    # Only the chosen model's tokenizer is loaded
+    start_encoding_load([MODELS[current_model][1]])
 
     print(colored(f"\nChatting with {MODELS[current_model][0]}. Type --help for available commands.", "green"))
     
@@ -165,24 +418,36 @@ async def main():
                 if new_model is None:
                     break
                 current_model = new_model
+                start_encoding_load([MODELS[current_model][1]])
                 print(colored(f"\nSwitched to {MODELS[current_model][0]}", "green"))
                 continue
                 
             elif message.lower() == "--clear":
                 chat_history.clear()
-                if hasattr(chat_with_model, 'gemini_chat'):
-                    delattr(chat_with_model, 'gemini_chat')
                 print(colored("\nChat history cleared", "green"))
                 continue
                 
             if not message:
                 continue
                 
-            response = await chat_with_model(current_model, message)
-            print(colored(f"\n{MODELS[current_model][0]}: {response}", "green"))
+            response, first_token_latency = await chat_with_model(current_model, message)
+            if first_token_latency is None:
+                # Nothing was streamed (error or empty reply), so print it in full
+                print(colored(f"\n{MODELS[current_model][0]}: {response}", "green"))
+            else:
+                print()
+                print(colored(f"(first token after {first_token_latency:.2f}s)", "cyan"))
             
         except Exception as e:
             print(colored(f"An error occurred: {str(e)}", "red"))
 
+async def run():
+    try:
+        await main()
+    finally:
+        # Only close the HTTP pool if something actually created it
+        if get_http_client.cache_info().currsize and get_http_client():
+            await get_http_client().aclose()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(run())
\ No newline at end of file
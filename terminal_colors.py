@@ -0,0 +1,29 @@
+import os
+import sys
+
+# ANSI escape codes, precomputed so printing never goes through a color library.
+# Same codes termcolor printed - its "white" is bright white
+ANSI_COLORS = {
+    "red": "\x1b[31m",
+    "green": "\x1b[32m",
+    "yellow": "\x1b[33m",
+    "cyan": "\x1b[36m",
+    "white": "\x1b[97m"
+}
+ANSI_RESET = "\x1b[0m"
+# Like termcolor, piped or redirected output and NO_COLOR get plain text
+USE_COLOR = sys.stdout.isatty() and not os.getenv("NO_COLOR")
+TOKEN_COLOR = ANSI_COLORS["green"] if USE_COLOR else ""
+TOKEN_RESET = ANSI_RESET if USE_COLOR else ""
+
+def colored(text, color):
+    if not USE_COLOR:
+        return text
+    return f"{ANSI_COLORS[color]}{text}{ANSI_RESET}"
+
+def print_token(token):
+    # Hot path while streaming - write straight to stdout without building strings
+    sys.stdout.write(TOKEN_COLOR)
+    sys.stdout.write(token)
+    sys.stdout.write(TOKEN_RESET)
+    sys.stdout.flush()